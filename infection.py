@@ -12,11 +12,13 @@
 # 2 develop infection over n iterations
 #     - for each iteration, try to infect the neighbours of cells infected in previous generations (if they aren't already infected)
 # 3 find optimal path through infection scenario
-#     - build an adjacency list from vacancies between infected cells and breadth-first-search for shortest path
+#     - breadth-first-search the vacancies between infected cells for shortest path
 
 # NOTES
 # used dictionaries to mostly replace lists, was a little trickier but ultimately a more robust solution
-# deques were used to maintain order in the adjacency list and for their O(1) pops and appends
+# infection state ended up in a numpy array though, propagating cell by cell through a dictionary was far too slow on big grids
+# the propagation step works on the infection packed 64 cells to a word and is compiled with numba, first run pays for the compile but it is cached to disk after that
+# the bfs is compiled with numba too and keeps its queue in a flat array, deques are still used for the path for their O(1) appends on both ends
 # overall program is pretty robust, handles small matricies well and i think large too (although this is hard to verify)
 # if i had more time i would probably like to write a test suite to check edge and corner cases
 # was thoroughly stumped by the no lists requirements for a good day or so but was rewarding to find a nice solution to it
@@ -25,7 +27,9 @@ import sys
 import math
 import random
 import argparse
-from collections import deque, OrderedDict
+import numpy as np
+from numba import njit, prange
+from collections import deque
 
 # USEAGE AND INPUT HANDLING
 # argparse handles input exceptions really well, tidies up code and gets rid of big try/except blocks
@@ -63,6 +67,76 @@ elif iterations < 0:
     sys.exit(1) # incorrect argument type
 
 # SOLUTION IMPLEMENTATION
+UNINFECTED = 255 # infected cells hold the generation they caught the infection in, generations past 254 saturate
+
+ZERO = np.uint64(0) # word constants are typed explicitly since numba turns mixed uint64 and int64 arithmetic into floats
+ONE = np.uint64(1)
+TOP = np.uint64(63)
+
+def pack(mask): # packs a (rows, cols) boolean mask into 64 cells per uint64 word, bit b of word w in row i is cell (i, 64 * w + b)
+    '''
+    return mask bit-packed into uint64 row words
+    '''
+    rows, cols = mask.shape
+    padded = np.zeros((rows, (cols + 63) // 64 * 64), np.bool_)
+    padded[:, :cols] = mask
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8').astype(np.uint64)
+
+@njit(parallel=True, cache=True)
+def step(bits, out, susceptible, grid, generation, chance): # one iteration over the bit-packed infection, 64 cells per word so neighbours are found with a handful of shifts instead of a lookup per cell. rows are spread over threads. reads from bits and writes to out so cells infected this iteration can't transmit until the next one. returns how many cells were exposed, once that hits zero the infection has nowhere left to go
+    '''
+    spread infection by one generation from bits into out, recording new infections in grid
+    '''
+    rows, words = bits.shape
+    exposed_cells = np.zeros(rows, np.int64) # counted per row, numba can't reduce a scalar from inside the nested loops
+    for i in prange(rows):
+        for w in range(words):
+            row = bits[i, w]
+            up = bits[i - 1, w] if i > 0 else ZERO
+            down = bits[i + 1, w] if i < rows - 1 else ZERO
+            left = (row << ONE) | (bits[i, w - 1] >> TOP if w > 0 else ZERO)
+            right = (row >> ONE) | (bits[i, w + 1] << TOP if w < words - 1 else ZERO)
+            exposed = (up | down | left | right) & susceptible[i, w] & ~row
+            caught = ZERO
+            if exposed:
+                for b in range(64):
+                    shift = np.uint64(b)
+                    if (exposed >> shift) & ONE:
+                        exposed_cells[i] += 1
+                        exposure = ((up >> shift) & ONE) + ((down >> shift) & ONE) + ((left >> shift) & ONE) + ((right >> shift) & ONE)
+                        if np.random.random() < chance[exposure]:
+                            caught |= ONE << shift
+                            grid[i, 64 * w + b] = generation
+            out[i, w] = row | caught
+    return exposed_cells.sum()
+
+@njit(cache=True)
+def search(state, cols): # standard bfs over the flattened grid, only the frontier cell is queued and each cell remembers its parent so the path is rebuilt once at the end. the queue is a flat array with head and tail indices since every cell is queued at most once. neighbours are worked out on the fly from the infection so no adjacency list has to be built up front
+    '''
+    return the bfs parent of every cell reached from the top left cell, -1 for cells never reached
+    '''
+    size = state.shape[0]
+    goal = size - 1
+    parents = np.full(size, -1, np.int32)
+    queue = np.empty(size, np.int32)
+    parents[0] = 0
+    queue[0] = 0
+    head, tail = 0, 1
+    while head < tail:
+        cell = queue[head]
+        head += 1
+        left = cell - 1 if cell % cols != 0 else -1
+        right = cell + 1 if (cell + 1) % cols != 0 else -1
+        for n in (cell - cols, cell + cols, left, right):
+            if n < 0 or n >= size or parents[n] != -1 or state[n] != UNINFECTED:
+                continue
+            parents[n] = cell
+            if n == goal:
+                return parents
+            queue[tail] = n
+            tail += 1
+    return parents
+
 # Opted for an OOP approach to keep program logic linear and code tidy
 class Infection:
 
@@ -74,94 +148,52 @@ class Infection:
         self.iterations = iterations
         self.generation = 0
         self.size = rows * cols
-        self.infected = {}
-        for i in range(self.size):
-            self.infected[i] = None
+        self._last = self.size - 1 # bottom right cell, the goal and the only corner other than 0 that is never infected
+        self.infected = np.full((rows, cols), UNINFECTED, np.uint8)
+        self._chance = 1 - (1 - risk) ** np.arange(5) # probability a cell with k infected neighbours catches it, each neighbour gets its own roll
+        susceptible = np.ones((rows, cols), np.bool_) # only depends on the grid shape so it is worked out once, masks off the corners and the padding past the last column
+        susceptible.flat[0] = susceptible.flat[-1] = False
+        self._susceptible = pack(susceptible)
 
-    def spawn(self): # used a set to prevent top left and bottom right cells being chosen as seeds, then pass to infect() to avoid repeating code later
+    def spawn(self): # seeds are sampled in one go from every cell except top left and bottom right, capped in case the seed percentage covers the corners too
         '''
         spawn initial infection scenario
         '''
-        positions = set(self.infected.keys())
-        positions.difference_update({0, self.size - 1})
-        for _ in range(math.floor(self.size * self.seed)):
-            random_pos = random.choice(tuple(positions))
-            self.infect(random_pos, 1)
-            positions.remove(random_pos)
-
-    def infect(self, pos, risk=None): # risk is 100% chance of infection for seeds and then user input for rest of the program, if infection is successful the dictionary value for the cell is updated to the current generation
-        '''
-        try to create an infected cell at a given position
-        '''
-        ir = self.risk if risk is None else risk
-        if random.random() <= ir and pos not in {0, self.size - 1}:
-            self.infected[pos] = self.generation
-
-    def get_neighbours(self, pos): # helper function to easily find cell neighbours, defaults to None if no neighbour in a specific direction, returns a dictionary for fast lookup later
-        '''
-        return the neighbouring positions of a given cell
-        '''
-        up = None if pos - self.cols < 0 else pos - self.cols
-        down = None if pos + self.cols >= self.size else pos + self.cols
-        left = None if pos % self.cols == 0 else pos - 1
-        right = None if (pos + 1) % self.cols == 0 else pos + 1
-        return {'u': up, 'd': down, 'l': left, 'r': right}
+        positions = range(1, self._last)
+        seeds = min(math.floor(self.size * self.seed), len(positions))
+        self.infected.flat[random.sample(positions, seeds)] = self.generation
 
-    def propagate(self): # main logic loop, dictionary makes it quick and easy to ensures only cells infected on the previous iteration can transmit the infection on the current iteration
+    def propagate(self): # main logic loop, packs the infection into bits once, hands each iteration to the compiled step() and swaps buffers. once no healthy cell is exposed nothing can change, so step() is skipped for the remaining generations while they are still counted
         '''
         spread infection from initial scenario
         '''
+        bits = pack(self.infected != UNINFECTED)
+        scratch = np.empty_like(bits)
+        settled = self.risk == 0
         while self.generation < self.iterations:
             self.generation += 1
-            for pos, gen in self.infected.items():
-                if gen is not None and gen < self.generation:
-                    neighbours = self.get_neighbours(pos)
-                    for _, n in neighbours.items():
-                        if n is not None:
-                            self.infect(n)
-        
-    def adjacency_list(self): # main data structure used for path finding, deque() is used for O(1) appends and pops, it also naturally lends to bfs on an unweighted graph
-        '''
-        return adjacency list of vacancies between infected cells
-        '''
-        adjacency_list = {}
-        for pos, gen in self.infected.items():
-            if gen is None:
-                adjacency_list[pos] = deque()
-                neighbours = self.get_neighbours(pos)
-                for _, n in neighbours.items():
-                    if n is not None:
-                        if self.infected[n] is None:
-                            adjacency_list[pos].append(n)
-        # print("\n".join("{}\t{}".format(k, v) for k, v in adjacency_list.items()))
-        return adjacency_list
-
-    def bfs(self): # standard bfs implementation, maybe slightly faster than usual with deque? treat non-infected cells like nodes in an unweighted graph in order to find shortest path between top left and bottom right
+            if settled:
+                continue
+            exposed = step(bits, scratch, self._susceptible, self.infected, min(self.generation, UNINFECTED - 1), self._chance)
+            bits, scratch = scratch, bits
+            settled = exposed == 0
+
+    def bfs(self): # the search itself runs compiled in search(), this just rebuilds the path by walking the parents back from the goal. a 1x1 grid has nowhere to go so it never has a path
         '''
         try to find shortest path between top left cell and bottom right cell using BFS
         '''
-        alist = self.adjacency_list()
-        start = deque()
-        start.append(0)
-        goal = self.size - 1
-        queue = deque()
-        visited = deque()
-        queue.insert(0, start)
-        while queue:
-            path = queue.popleft()
-            cell = path[-1]
-            if cell not in visited:
-                neighbours = alist[cell]
-                for n in neighbours:
-                    new_path = deque(path)
-                    new_path.append(n)
-                    queue.append(new_path)
-                    if n == goal:
-                        return new_path
-                visited.append(cell)
-        return None
-
-    def compute_path(self): # logic to compute positions into i, j coordinates and then print them as output to the console
+        parents = search(self.infected.ravel(), self.cols)
+        if self._last == 0 or parents[self._last] < 0:
+            return None
+        n = self._last
+        path = deque()
+        path.append(n)
+        while n != 0:
+            n = int(parents[n])
+            path.appendleft(n)
+        return path
+
+    def compute_path(self): # logic to compute positions into i, j coordinates and then print them as output to the console, row and column both come out of one divmod by the row length
         '''
         computes (i, j) coordinates from shortest path positions
         '''
@@ -170,35 +202,33 @@ class Infection:
             print("No path could be found.")
             sys.exit(0) # program finished successfully
         else:
-            path = OrderedDict()
             for pos in route:
-                i = math.floor(pos / self.rows)
-                j = pos % self.cols
-                path[pos] = (i, j)
-            for _, coordinate in path.items():
-                print(coordinate)
+                print(divmod(pos, self.cols))
             sys.exit(0) # program finished successfully
 
-    def show_infection(self): # useful debugging tool, displays a nice little graph of the infection, was fun to write. used the initail None condition for cells in the infected dictionary to work out where to display markers
+    def show_infection(self): # useful debugging tool, displays a nice little graph of the infection, was fun to write. reads a flat byte copy of the grid and uses the UNINFECTED marker to work out where to display markers. the whole frame is built up in a list and written in one go, printing cell by cell was painfully slow on big grids
         '''
         *for debugging* visualises the infection
         '''
-        print("  ", end = "")
+        state = self.infected.tobytes()
+        border = "  " + ("+" + "-" * 3) * self.cols + "+\n"
+        parts = ["  "]
         for j in range(self.cols):
-            print("  {} ".format(j), end = "")
-        print("")
+            parts.append("  {} ".format(j))
+        parts.append("\n")
         for i in range(self.rows):
-            print("  " + ("+" + "-" * 3) * self.cols + "+")
-            print("{} ".format(i), end = "")
+            parts.append(border)
+            parts.append("{} ".format(i))
             for j in range(self.cols):
-                if self.infected[(i * self.cols + j)] is None:
+                if state[i * self.cols + j] == UNINFECTED:
                     special_char = " "
                 else:
                     special_char = "o"
-                print("|" + " {} ".format(special_char), end="")
-            print("|")
-        print("  " + ("+" + "-" * 3) * self.cols + "+")
-        print("generation: {}".format(self.generation))
+                parts.append("|" + " {} ".format(special_char))
+            parts.append("|\n")
+        parts.append(border)
+        parts.append("generation: {}\n".format(self.generation))
+        sys.stdout.write("".join(parts))
 
 
 if __name__ == "__main__": # thought it was a bit nicer to instantiate a new "infection" case for each run of the problem. also makes it easier to test method functionality